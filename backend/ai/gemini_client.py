@@ -1,45 +1,269 @@
+import asyncio
+import datetime
 import logging
+import threading
+import time
 import google.generativeai as genai
+from google.generativeai import caching
 
 logger = logging.getLogger(__name__)
 
+# genai.configure() sets process-wide state, so only do it once per API key
+_configure_lock = threading.Lock()
+_configured_api_key = None
+
+
+def _configure_once(api_key: str):
+    global _configured_api_key
+    with _configure_lock:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+
+# Output budget for the rare answer that doesn't fit in the default max_output_tokens
+RETRY_MAX_OUTPUT_TOKENS = 2048
+
+# Explicit Gemini context caches for static prompt prefixes, shared by all clients.
+# (model_name, prefix) -> (model bound to the cached content or None if caching is unavailable, expires_at)
+PREFIX_CACHE_TTL_SECONDS = 3600
+# Gemini rejects explicit caches below ~1024 tokens; at roughly 4 characters per token,
+# shorter prefixes aren't worth a create call that is bound to fail
+MIN_CACHEABLE_PREFIX_CHARS = 4 * 1024
+_prefix_caches = {}
+_prefix_cache_refreshing = set()
+_prefix_cache_lock = threading.Lock()
+
+
 class GeminiClient:
     def __init__(self, api_key):
         if not api_key:
             raise ValueError("API key is required for GeminiClient")
-        
+
         # Configure the Gemini API with the provided key
-        genai.configure(api_key=api_key)
+        _configure_once(api_key)
         self.model_name = "gemini-2.5-flash"
-        
+
         # Create a generative model instance
         self.model = genai.GenerativeModel(self.model_name)
+        self.generation_config = {
+            "temperature": 0.3,
+            "top_p": 0.8,
+            "max_output_tokens": 512,
+            # A single SQL statement is complete at its first ';', so stop decoding there.
+            # The terminator is not returned; _clean_sql_output re-appends it. A ';' inside a
+            # string literal also stops decoding; SQLGenerator detects that and regenerates
+            # with stop_sequences=None.
+            "stop_sequences": [";"],
+        }
+        self._cached_prefix = None
+
+    def enable_prefix_cache(self, prefix: str):
+        """
+        Upload `prefix` (system rules + schema + examples) as Gemini cached content so
+        later prompts starting with it only send and pay prefill for the remainder.
+        Gemini 2.5 also caches repeated prefixes implicitly, so failure here is harmless.
+        Blocks on the create call; call it off the event loop.
+        """
+        if len(prefix) < MIN_CACHEABLE_PREFIX_CHARS:
+            logger.info("Prompt prefix too short for explicit context caching; relying on implicit caching")
+            return
+        self._cached_prefix = prefix
+        self._get_cached_model(prefix)
+
+    def _peek_cached_model(self, key: tuple):
+        # Returns (model, needs_refresh). Only one caller per key is told to refresh;
+        # the others send full prompts until the new cache is in place.
+        with _prefix_cache_lock:
+            entry = _prefix_caches.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0], False
+            if key in _prefix_cache_refreshing:
+                return None, False
+            _prefix_cache_refreshing.add(key)
+            return None, True
+
+    def _refresh_cached_model(self, key: tuple):
+        # Network call; runs outside the lock so other clients aren't held up
+        model_name, prefix = key
+        try:
+            cached_content = caching.CachedContent.create(
+                model=f"models/{model_name}",
+                contents=[prefix],
+                ttl=datetime.timedelta(seconds=PREFIX_CACHE_TTL_SECONDS),
+            )
+            cached_model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+            logger.info("Created Gemini context cache %s", cached_content.name)
+        except Exception as e:
+            # Don't retry until the TTL passes
+            logger.warning("Gemini context caching unavailable, sending full prompts: %s", e)
+            cached_model = None
+        with _prefix_cache_lock:
+            # Refresh slightly before the server-side TTL runs out
+            _prefix_caches[key] = (cached_model, time.monotonic() + PREFIX_CACHE_TTL_SECONDS - 60)
+            _prefix_cache_refreshing.discard(key)
+        return cached_model
+
+    def _get_cached_model(self, prefix: str):
+        key = (self.model_name, prefix)
+        cached_model, needs_refresh = self._peek_cached_model(key)
+        return self._refresh_cached_model(key) if needs_refresh else cached_model
+
+    async def _aget_cached_model(self, prefix: str):
+        key = (self.model_name, prefix)
+        cached_model, needs_refresh = self._peek_cached_model(key)
+        if needs_refresh:
+            # Keep the create RPC off the event loop
+            cached_model = await asyncio.to_thread(self._refresh_cached_model, key)
+        return cached_model
+
+    def _invalidate_cached_model(self, prefix: str):
+        with _prefix_cache_lock:
+            _prefix_caches.pop((self.model_name, prefix), None)
 
-    def generate_sql(self, full_prompt: str) -> str:
+    def _resolve_model(self, full_prompt: str):
+        # Returns (model, contents, prefix) where prefix is set when the cached model is used
+        prefix = self._cached_prefix
+        if prefix and full_prompt.startswith(prefix):
+            cached_model = self._get_cached_model(prefix)
+            if cached_model is not None:
+                return cached_model, full_prompt[len(prefix):], prefix
+        return self.model, full_prompt, None
+
+    async def _aresolve_model(self, full_prompt: str):
+        prefix = self._cached_prefix
+        if prefix and full_prompt.startswith(prefix):
+            cached_model = await self._aget_cached_model(prefix)
+            if cached_model is not None:
+                return cached_model, full_prompt[len(prefix):], prefix
+        return self.model, full_prompt, None
+
+    def generate_sql(self, full_prompt: str, **config_overrides) -> str:
         try:
             # Generate content using the correct API
-            logger.info(f"Generating SQL with model: {self.model_name}")
-            
-            generation_config = {
-                "temperature": 0.3,
-                "top_p": 0.8,
-                "max_output_tokens": 500,
-            }
-            
-            response = self.model.generate_content(
+            logger.info("Generating SQL with model: %s", self.model_name)
+
+            response = self._generate(full_prompt, self._build_config(**config_overrides))
+            if self._hit_token_limit(response) and not config_overrides:
+                logger.warning("SQL generation hit max_output_tokens; retrying with a larger budget")
+                response = self._generate(full_prompt, self._build_config(max_output_tokens=RETRY_MAX_OUTPUT_TOKENS))
+            return self._extract_text(response)
+
+        except Exception as e:
+            # exc_info defers traceback formatting to the logging handler
+            logger.error("Gemini API generation error: %s", e, exc_info=True)
+            raise
+
+    async def agenerate_sql(self, full_prompt: str, **config_overrides) -> str:
+        # Non-blocking variant: awaits the SDK's async transport so concurrent
+        # requests overlap on the event loop instead of queueing behind each other.
+        # config_overrides replace generation_config entries; a None value removes the entry.
+        try:
+            logger.info("Generating SQL (async) with model: %s", self.model_name)
+
+            generation_config = self._build_config(**config_overrides)
+            response = await self._agenerate(full_prompt, generation_config)
+            if self._hit_token_limit(response) and not config_overrides:
+                logger.warning("SQL generation hit max_output_tokens; retrying with a larger budget")
+                response = await self._agenerate(full_prompt, self._build_config(max_output_tokens=RETRY_MAX_OUTPUT_TOKENS))
+            return self._extract_text(response)
+
+        except Exception as e:
+            logger.error("Gemini API async generation error: %s", e, exc_info=True)
+            raise
+
+    def _build_config(self, **overrides) -> dict:
+        config = {**self.generation_config, **overrides}
+        return {k: v for k, v in config.items() if v is not None}
+
+    def _generate(self, full_prompt: str, generation_config: dict):
+        model, contents, prefix = self._resolve_model(full_prompt)
+        try:
+            return model.generate_content(
+                contents,
+                generation_config=generation_config
+            )
+        except Exception as e:
+            if prefix is None:
+                raise
+            # Cached content may have been evicted server-side; retry with the full prompt
+            logger.warning("Cached-content generation failed, retrying uncached: %s", e)
+            self._invalidate_cached_model(prefix)
+            return self.model.generate_content(
                 full_prompt,
                 generation_config=generation_config
             )
-            
-            # Extract the text from the response
-            if hasattr(response, 'text'):
-                return response.text.strip()
-            else:
-                logger.warning(f"Unexpected response format: {type(response)}")
-                return str(response).strip()
-                
+
+    async def _agenerate(self, full_prompt: str, generation_config: dict):
+        model, contents, prefix = await self._aresolve_model(full_prompt)
+        try:
+            return await model.generate_content_async(
+                contents,
+                generation_config=generation_config
+            )
         except Exception as e:
-            logger.error(f"Gemini API generation error: {e}")
-            import traceback
-            logger.error(f"Full traceback: {traceback.format_exc()}")
-            raise
+            if prefix is None:
+                raise
+            logger.warning("Cached-content generation failed, retrying uncached: %s", e)
+            self._invalidate_cached_model(prefix)
+            return await self.model.generate_content_async(
+                full_prompt,
+                generation_config=generation_config
+            )
+
+    def _hit_token_limit(self, response) -> bool:
+        candidates = getattr(response, "candidates", None)
+        if not candidates:
+            return False
+        finish_reason = getattr(candidates[0], "finish_reason", None)
+        return getattr(finish_reason, "name", finish_reason) == "MAX_TOKENS"
+
+    async def aping(self):
+        # One-token request that opens the connection to Gemini ahead of the first real call
+        await self.model.generate_content_async(
+            "ping",
+            generation_config={"max_output_tokens": 1}
+        )
+
+    async def astream_sql(self, full_prompt: str):
+        # Yields text chunks as Gemini decodes them, so callers can show output before completion
+        logger.info("Streaming SQL with model: %s", self.model_name)
+
+        model, contents, prefix = await self._aresolve_model(full_prompt)
+        # No ';' stop sequence: it would also fire inside a string literal, and the caller
+        # stops reading once the statement's real terminator has arrived
+        generation_config = self._build_config(stop_sequences=None)
+        try:
+            response = await model.generate_content_async(
+                contents,
+                generation_config=generation_config,
+                stream=True
+            )
+        except Exception as e:
+            if prefix is None:
+                logger.error("Gemini API streaming error: %s", e)
+                raise
+            logger.warning("Cached-content generation failed, retrying uncached: %s", e)
+            self._invalidate_cached_model(prefix)
+            response = await self.model.generate_content_async(
+                full_prompt,
+                generation_config=generation_config,
+                stream=True
+            )
+
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # .text raises on a chunk with no parts, e.g. one carrying only a finish_reason
+                continue
+            if text:
+                yield text
+
+    def _extract_text(self, response) -> str:
+        # Extract the text from the response
+        if hasattr(response, 'text'):
+            return response.text.strip()
+        else:
+            logger.warning("Unexpected response format: %s", type(response))
+            return str(response).strip()
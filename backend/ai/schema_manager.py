@@ -1,42 +1,69 @@
 import json
 from pathlib import Path
 import os
+import threading
+
+try:
+    import orjson  # faster JSON parsing when available
+except ImportError:
+    orjson = None
 
 _schema_cache = None
+_formatted_schema_cache = None
+# Reentrant: get_formatted_schema holds it while load_schema takes it again
+_schema_lock = threading.RLock()
 
 def load_schema(schema_path: str = None):
     global _schema_cache
     if _schema_cache is None:
-        if schema_path is None:
-            # Get the path relative to this file
-            schema_path = Path(__file__).parent / "schema" / "schema.json"
-        with open(schema_path, "r") as f:
-            _schema_cache = json.load(f)
+        # Double-checked so concurrent first calls parse the file only once
+        with _schema_lock:
+            if _schema_cache is None:
+                if schema_path is None:
+                    # Get the path relative to this file
+                    schema_path = Path(__file__).parent / "schema" / "schema.json"
+                if orjson is not None:
+                    _schema_cache = orjson.loads(Path(schema_path).read_bytes())
+                else:
+                    with open(schema_path, "r") as f:
+                        _schema_cache = json.load(f)
     return _schema_cache
 
 
-def format_schema(schema_json: dict) -> str:
-    lines = []
+def clear_schema_cache():
+    """Drop the cached schema so the next load_schema() re-reads the file."""
+    global _schema_cache, _formatted_schema_cache
+    with _schema_lock:
+        _schema_cache = None
+        _formatted_schema_cache = None
+
+
+def get_formatted_schema() -> str:
+    """format_schema(load_schema()), computed once per process."""
+    global _formatted_schema_cache
+    formatted = _formatted_schema_cache
+    if formatted is None:
+        # Under the lock, so a concurrent clear_schema_cache() can't be undone by a
+        # string formatted from the schema it just dropped
+        with _schema_lock:
+            if _formatted_schema_cache is None:
+                _formatted_schema_cache = format_schema(load_schema())
+            formatted = _formatted_schema_cache
+    return formatted
+
+
+def iter_tables(schema_json: dict):
+    """Yield (table_name, [column names]) for each table in either supported schema shape."""
     # Support two shapes:
     # 1) {"tableName": "T", "columns": [{"name": "COL", "type": "..."} , ...]}
     # 2) {"TABLE_A": ["COL1", "COL2"], "TABLE_B": [{"name": "COL1"}, "COL2", ...]}
     if isinstance(schema_json, dict) and "tableName" in schema_json and "columns" in schema_json:
-        table_name = schema_json.get("tableName")
-        raw_columns = schema_json.get("columns", [])
-        column_names = []
-        for col in raw_columns:
-            if isinstance(col, dict):
-                name = col.get("name")
-                if name:
-                    column_names.append(name)
-            elif isinstance(col, str):
-                column_names.append(col)
-        cols_str = ", ".join(column_names)
-        lines.append(f"TABLE: {table_name} ({cols_str})")
-        return "\n".join(lines)
-
-    # Fallback: treat schema_json as mapping of table -> columns
-    for table, columns in schema_json.items():
+        tables = [(schema_json.get("tableName"), schema_json.get("columns", []))]
+    else:
+        # Fallback: treat schema_json as mapping of table -> columns
+        tables = schema_json.items()
+
+    for table, columns in tables:
         column_names = []
         if isinstance(columns, list):
             for col in columns:
@@ -46,6 +73,13 @@ def format_schema(schema_json: dict) -> str:
                         column_names.append(name)
                 elif isinstance(col, str):
                     column_names.append(col)
-        cols_str = ", ".join(column_names)
-        lines.append(f"TABLE: {table} ({cols_str})")
-    return "\n".join(lines)
+        yield table, column_names
+
+
+def format_table(table: str, column_names: list) -> str:
+    cols_str = ", ".join(column_names)
+    return f"TABLE: {table} ({cols_str})"
+
+
+def format_schema(schema_json: dict) -> str:
+    return "\n".join(format_table(table, column_names) for table, column_names in iter_tables(schema_json))
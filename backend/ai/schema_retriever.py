@@ -0,0 +1,60 @@
+import math
+import re
+from collections import Counter
+
+from .schema_manager import iter_tables, format_table
+
+DEFAULT_TOP_K = 8
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> list:
+    # Split identifiers like CARD_ISSUE_DATE into words and fold simple plurals (claims -> claim)
+    words = _TOKEN_RE.findall(text.lower().replace("_", " "))
+    return [w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words]
+
+
+def _vectorize(tokens: list) -> dict:
+    counts = Counter(tokens)
+    norm = math.sqrt(sum(c * c for c in counts.values()))
+    return {t: c / norm for t, c in counts.items()} if norm else {}
+
+
+class SchemaRetriever:
+    """
+    Picks the top-k tables relevant to a question so wide schemas don't have to be
+    sent to Gemini in full. Tables are scored by cosine similarity between the
+    question's words and the words in the table and column names. Tables in
+    `always_include` (join hubs) are always kept.
+    """
+
+    def __init__(self, schema_json: dict, top_k: int = DEFAULT_TOP_K, always_include: tuple = ()):
+        self.top_k = top_k
+        self.always_include = frozenset(always_include)
+        self._tables = []  # table names
+        self._blocks = []  # formatted "TABLE: T (cols)" per table
+        self._vectors = []  # term vectors per table
+        for table, column_names in iter_tables(schema_json):
+            self._tables.append(table)
+            self._blocks.append(format_table(table, column_names))
+            self._vectors.append(_vectorize(_tokens(table) + [t for c in column_names for t in _tokens(c)]))
+
+    @property
+    def prunable(self) -> bool:
+        # With k or fewer tables there is nothing to prune and the full, cacheable schema is used
+        return len(self._tables) > self.top_k
+
+    def retrieve_relevant_schema(self, user_question: str) -> str:
+        if not self.prunable:
+            return "\n".join(self._blocks)
+
+        question = _vectorize(_tokens(user_question))
+        scores = [
+            sum(w * vector.get(t, 0.0) for t, w in question.items())
+            for vector in self._vectors
+        ]
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        selected = set(ranked[:self.top_k])
+        selected.update(i for i, table in enumerate(self._tables) if table in self.always_include)
+        # Keep the original schema order so prompts for similar questions stay similar
+        return "\n".join(self._blocks[i] for i in sorted(selected))
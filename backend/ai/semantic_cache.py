@@ -0,0 +1,138 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+# Filler words that change phrasing but not the SQL a question should produce.
+# Words that change meaning (not, no, last, this, next, top, ...) are deliberately kept.
+_STOPWORDS = frozenset({
+    "a", "an", "the", "me", "my", "i", "we", "us", "our", "you", "please",
+    "show", "list", "give", "get", "find", "display", "fetch", "return",
+    "tell", "what", "which", "that", "who", "are", "is", "was", "were",
+    "be", "of", "for", "to", "can", "could", "would", "all", "there",
+    "report", "records", "rows", "data",
+})
+# Words that make the order of the terms around them matter: "claimed exceeds approved"
+# is not "approved exceeds claimed". Questions containing one only match in the same order.
+_ORDER_WORDS = frozenset({
+    "than", "exceed", "exceeds", "exceeding", "before", "after", "versus", "vs",
+    "over", "under", "above", "below", "from", "per", "by",
+})
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+# Values a question filters on: quoted strings, numbers, and capitalised words (names, codes,
+# "district A"). These end up as SQL literals, so they must match exactly, in order and case.
+_LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:[.,]\d+)*|\b\w*[A-Z]\w*\b")
+
+
+@lru_cache(maxsize=4096)
+def _content_words(question: str) -> tuple:
+    return tuple(t for t in _TOKEN_RE.findall(question.lower()) if t not in _STOPWORDS)
+
+
+@lru_cache(maxsize=4096)
+def question_literals(question: str) -> tuple:
+    # The first word is capitalised by grammar, not because it's a value
+    text = question.strip()
+    return tuple(_LITERAL_RE.findall(text[:1].lower() + text[1:]))
+
+
+def question_guard(question: str) -> tuple:
+    """
+    Return what must be identical for two questions to share SQL: their literals, plus
+    their content words in order when an order word (than, before, by, ...) is present.
+    """
+    words = _content_words(question)
+    return question_literals(question), (words if _ORDER_WORDS.intersection(words) else ())
+
+
+@lru_cache(maxsize=4096)
+def embed_question(question: str) -> tuple:
+    """
+    Return a sparse, L2-normalised bag-of-words vector as a sorted tuple of (token, weight).
+    Word order is ignored; question_guard covers the questions where it matters.
+    """
+    counts = Counter(_content_words(question))
+    norm = math.sqrt(sum(c * c for c in counts.values()))
+    if not norm:
+        return ()
+    return tuple(sorted((t, c / norm) for t, c in counts.items()))
+
+
+def cosine_similarity(a: tuple, b: tuple) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    weights = dict(b)
+    return sum(w * weights.get(t, 0.0) for t, w in a)
+
+
+class SemanticCache:
+    """
+    Stopword-normalised question cache. Questions that differ only in filler words and
+    word order, such as "show pending claims" and "list claims that are pending", map to
+    the same cached SQL when their vectors are at least `threshold` similar and their
+    question_guard matches exactly, so "... in 2023" never answers "... in 2024".
+    Entries are namespaced (e.g. per schema fingerprint) and expire after `ttl_seconds`.
+
+    A lookup scores only the entries with the same namespace and guard, not the whole cache.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # (namespace, guard, vector) -> (sql, expires_at), LRU order
+        self._buckets = {}  # (namespace, guard) -> set of vectors stored under it
+        self._lock = threading.Lock()
+
+    def lookup(self, namespace: str, question: str):
+        vector = embed_question(question)
+        if not vector:
+            return None
+        bucket_key = (namespace, question_guard(question))
+        weights = dict(vector)
+        now = time.monotonic()
+        best_key, best_score = None, 0.0
+        with self._lock:
+            for candidate in list(self._buckets.get(bucket_key, ())):
+                key = bucket_key + (candidate,)
+                if self._entries[key][1] < now:
+                    self._remove(key)
+                    continue
+                # Both vectors are L2-normalised, so the dot product is the cosine similarity
+                score = sum(w * weights.get(t, 0.0) for t, w in candidate)
+                if score > best_score:
+                    best_key, best_score = key, score
+            if best_key is None or best_score < self.threshold:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][0]
+
+    def insert(self, namespace: str, question: str, sql: str):
+        vector = embed_question(question)
+        if not vector or not sql:
+            return
+        bucket_key = (namespace, question_guard(question))
+        with self._lock:
+            key = bucket_key + (vector,)
+            self._entries[key] = (sql, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(bucket_key, set()).add(vector)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _remove(self, key: tuple):
+        # Caller holds self._lock
+        del self._entries[key]
+        bucket = self._buckets[key[:2]]
+        bucket.discard(key[2])
+        if not bucket:
+            del self._buckets[key[:2]]
@@ -1,57 +1,319 @@
 from .gemini_client import GeminiClient
-from .schema_manager import load_schema, format_schema
+from .schema_manager import load_schema, get_formatted_schema, clear_schema_cache
 from .prompt_builder import build_gemini_prompt
+from .schema_retriever import SchemaRetriever
+from .semantic_cache import SemanticCache, embed_question, cosine_similarity
+from collections import OrderedDict
+import asyncio
+from functools import lru_cache
+import hashlib
+import json
 import re
+import string
+import threading
+import time
+
+# Exact-match cache of generated SQL, shared by all SQLGenerator instances.
+# Keys carry schema and few-shot fingerprints so a prompt change never serves stale SQL;
+# entries expire so a bad generation isn't replayed for the life of the process.
+QUERY_CACHE_MAX_SIZE = 1024
+QUERY_CACHE_TTL_SECONDS = 3600
+_query_cache = OrderedDict()  # key -> (sql, expires_at)
+_query_cache_lock = threading.Lock()
+# Paraphrase-tolerant fallback consulted after an exact-match miss
+_semantic_cache = SemanticCache(threshold=0.95, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+_QUESTION_PLACEHOLDER = "\x00USER_QUESTION\x00"
+# Gemini calls in flight per cache key, so concurrent identical questions share one call
+_inflight = {}
+# Bumped by SQLGenerator.invalidate_schema_cache(); generators built before a bump are stale
+_schema_generation = 0
+# Number of few-shot examples sent per question once there are more than this many
+FEW_SHOT_TOP_K = 3
+
+# Output-cleanup patterns, compiled once. Keyword patterns are case-sensitive and run
+# against an ASCII-upper-cased copy of the text (same length, so spans map back 1:1).
+_ASCII_UPPER = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+# Upper bound on model output scanned by the cleanup regexes; real answers are a few KB at most
+MAX_OUTPUT_CHARS = 32768
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*([\s\S]*?)```")
+_LABEL_RE = re.compile(r"^(SQL\s*QUERY\s*:|SQL\s*:)")
+# Statement bodies skip over '...' literals, so a ';' inside one ('a;b') doesn't end the statement
+_SELECT_RE = re.compile(r"(SELECT(?:'[^']*'|[^';])+;)")
+_STATEMENT_RE = re.compile(
+    r"^[ \t]*(?:SQL\s*(?:QUERY\s*)?:\s*)?(SELECT\b(?:'[^']*'|[^';])*)(?:;|\Z)",
+    re.MULTILINE,
+)
+_TERMINATED_RE = re.compile(r"\bSELECT\b(?:'[^']*'|[^';])*;")
+_SELECT_START_RE = re.compile(r"\bSELECT\b")
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def clear_query_cache():
+    """Drop all cached SQL (exact and semantic), keeping schema and generators."""
+    with _query_cache_lock:
+        _query_cache.clear()
+    _semantic_cache.clear()
+
+
+def _statement_terminated(text: str) -> bool:
+    # True once a SELECT has been closed by a ';' outside any string literal
+    return _TERMINATED_RE.search(text.translate(_ASCII_UPPER)) is not None
+
+
+def _cut_inside_literal(text: str) -> bool:
+    # The ';' stop sequence fired inside a string literal: the statement has an odd number of quotes
+    m = _SELECT_START_RE.search(text.translate(_ASCII_UPPER))
+    return m is not None and text.count("'", m.start()) % 2 == 1
+
+
+@lru_cache(maxsize=256)
+def clean_sql_output(text: str) -> str:
+    """Sanitize raw model output: strip markdown fences, language tags, and leading labels."""
+    if not text:
+        return text
+    # Bound regex work if the model ever returns runaway text
+    cleaned = text[:MAX_OUTPUT_CHARS].strip()
+    # Remove fenced code blocks ```sql ... ``` or ``` ...
+    fenced_match = _FENCE_RE.search(cleaned)
+    if fenced_match:
+        cleaned = fenced_match.group(1).strip()
+    upper = cleaned.translate(_ASCII_UPPER)
+    # First statement starting a line (after an optional 'SQL:' label), up to a ';' outside
+    # string literals or the end. The ';' is often absent because generation stops on it.
+    m = _STATEMENT_RE.search(upper)
+    if m:
+        return cleaned[m.start(1):m.end(1)].rstrip() + ";"
+    # Fallback: try to extract the first SELECT ... ; span anywhere in the text
+    m = _SELECT_RE.search(upper)
+    if m:
+        return cleaned[m.start(1):m.end(1)].strip()
+    # Last fallback: return cleaned as-is, minus any leading label
+    m = _LABEL_RE.match(upper)
+    return cleaned[m.end():].strip() if m else cleaned
+
 
 class SQLGenerator:
-    def __init__(self, few_shots: list, api_key: str):
+    def __init__(self, few_shots: list, api_key: str, validator=None):
+        # Taken before the schema is read, so an invalidation during construction marks this stale
+        self._schema_generation = _schema_generation
         # Load fixed schema once and format for prompt context
         schema_json = load_schema()  # returns JSON dict from file
-        self.schema_context = format_schema(schema_json)  # formatted schema string
+        self.schema_context = get_formatted_schema()  # formatted schema string, cached per process
+        self.schema_retriever = SchemaRetriever(schema_json)
         self.few_shots = few_shots
+        self._few_shot_vectors = [embed_question(fs["q"]) for fs in few_shots]
         self.gemini_client = GeminiClient(api_key=api_key)
-
-    def generate_query(self, user_question: str) -> str:
-        # Build full combined prompt using the shared prompt builder
-        prompt = build_gemini_prompt(
-            user_question=user_question,
+        # Optional sql -> (is_valid, error_message) check; only SQL that passes it is cached
+        self.validator = validator
+        self._schema_fp = _fingerprint(self.schema_context)
+        self._fs_fp = _fingerprint(json.dumps(few_shots, sort_keys=True))
+        # Everything but the question is static, so build the prompt once and split it
+        template = build_gemini_prompt(
+            user_question=_QUESTION_PLACEHOLDER,
             few_shots=self.few_shots,
             schema_context=self.schema_context,
         )
+        self._prompt_prefix, self._prompt_suffix = template.split(_QUESTION_PLACEHOLDER)
+        if not self._uses_question_specific_prompt():
+            self.gemini_client.enable_prefix_cache(self._prompt_prefix)
+
+    @classmethod
+    def invalidate_schema_cache(cls):
+        """
+        Forget the process-wide schema, shared generators and cached SQL, e.g. after
+        schema.json changes. New generators pick up the schema on construction, and
+        existing ones report is_current() == False.
+        """
+        global _schema_generation
+        clear_schema_cache()
+        with _sql_generators_lock:
+            _schema_generation += 1
+            _sql_generators.clear()
+        clear_query_cache()
+
+    def is_current(self) -> bool:
+        """False once invalidate_schema_cache() has run since this generator was built."""
+        return self._schema_generation == _schema_generation
+
+    def generate_query(self, user_question: str, no_cache: bool = False) -> str:
+        key = self._cache_key(user_question)
+        cached = None if no_cache else self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        prompt = self._build_prompt(user_question)
 
         # Call Gemini API to generate SQL
         raw_output = self.gemini_client.generate_sql(prompt)
+        if _cut_inside_literal(raw_output):
+            # Decoding stopped at a ';' inside a string literal; regenerate without the stop sequence
+            raw_output = self.gemini_client.generate_sql(prompt, stop_sequences=None)
         
         # Sanitize: strip markdown fences, language tags, and leading labels
         sql = self._clean_sql_output(raw_output)
+        if not no_cache:
+            self._cache_put(key, sql)
         
         # Return SQL for further processing
         return sql
 
+    async def agenerate_query(self, user_question: str, no_cache: bool = False) -> str:
+        # Async counterpart of generate_query for use inside the FastAPI event loop
+        key = self._cache_key(user_question)
+        if no_cache:
+            return await self._agenerate_uncached(user_question)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        # Questions arriving while the same one is being generated wait for that call
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._agenerate_uncached(user_question, key))
+            _inflight[key] = task
+            task.add_done_callback(lambda _: _inflight.pop(key, None))
+        # Shielded so one cancelled request doesn't cancel the call the others wait on
+        return await asyncio.shield(task)
+
+    async def _agenerate_uncached(self, user_question: str, key: tuple = None) -> str:
+        prompt = self._build_prompt(user_question)
+        raw_output = await self.gemini_client.agenerate_sql(prompt)
+        if _cut_inside_literal(raw_output):
+            # Decoding stopped at a ';' inside a string literal; regenerate without the stop sequence
+            raw_output = await self.gemini_client.agenerate_sql(prompt, stop_sequences=None)
+        sql = self._clean_sql_output(raw_output)
+        if key is not None:
+            self._cache_put(key, sql)
+        return sql
+
+    async def agenerate_queries(self, user_questions: list, concurrency: int = 8) -> list:
+        """Generate SQL for several questions concurrently, at most `concurrency` Gemini calls in flight."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(user_question):
+            async with semaphore:
+                return await self.agenerate_query(user_question)
+
+        return await asyncio.gather(*(bounded(q) for q in user_questions))
+
+    async def astream_query(self, user_question: str, no_cache: bool = False):
+        """
+        Yield raw SQL text as it is generated, stopping as soon as the statement's
+        terminating ';' arrives. The cleaned SQL is cached only if that ';' arrived;
+        callers should run the final text through _clean_sql_output themselves.
+        """
+        key = self._cache_key(user_question)
+        cached = None if no_cache else self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        prompt = self._build_prompt(user_question)
+        parts = []
+        terminated = False
+        stream = self.gemini_client.astream_sql(prompt)
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                yield chunk
+                # Only the first statement is used, so don't wait for any trailing text
+                if ";" in chunk and _statement_terminated("".join(parts)):
+                    terminated = True
+                    break
+        finally:
+            # Close the Gemini stream now instead of whenever the generator is collected
+            await stream.aclose()
+
+        # A stream that ended before the closing ';' may be truncated, so don't remember it
+        if terminated and not no_cache:
+            self._cache_put(key, self._clean_sql_output("".join(parts)))
+
+    def _cache_key(self, user_question: str) -> tuple:
+        # Whitespace differences ("How many  claims?") share an entry; case is kept because
+        # literals like 'RAVI' vs 'ravi' compare case-sensitively in Oracle
+        return (" ".join(user_question.split()), self._schema_fp, self._fs_fp)
+
+    def _cache_get(self, key: tuple):
+        with _query_cache_lock:
+            entry = _query_cache.get(key)
+            if entry is not None:
+                sql, expires_at = entry
+                if expires_at >= time.monotonic():
+                    _query_cache.move_to_end(key)
+                    return sql
+                del _query_cache[key]
+        return _semantic_cache.lookup(self._schema_fp + self._fs_fp, key[0])
+
+    def _cache_put(self, key: tuple, sql: str):
+        # Don't remember empty or rejected output; a retry should get a fresh generation
+        if not sql or (self.validator is not None and not self.validator(sql)[0]):
+            return
+        with _query_cache_lock:
+            _query_cache[key] = (sql, time.monotonic() + QUERY_CACHE_TTL_SECONDS)
+            _query_cache.move_to_end(key)
+            if len(_query_cache) > QUERY_CACHE_MAX_SIZE:
+                _query_cache.popitem(last=False)
+        _semantic_cache.insert(self._schema_fp + self._fs_fp, key[0], sql)
+
+    def _uses_question_specific_prompt(self) -> bool:
+        # Wide schemas and long example lists are trimmed per question, so no shared prefix
+        return self.schema_retriever.prunable or len(self.few_shots) > FEW_SHOT_TOP_K
+
+    def _build_prompt(self, user_question: str) -> str:
+        if self._uses_question_specific_prompt():
+            # Wide schema or many examples: only send the parts relevant to this question
+            return build_gemini_prompt(
+                user_question=user_question,
+                few_shots=self._select_few_shots(user_question),
+                schema_context=self.schema_retriever.retrieve_relevant_schema(user_question),
+            )
+        # Equivalent to build_gemini_prompt(...) but reuses the precomputed static parts
+        return self._prompt_prefix + user_question + self._prompt_suffix
+
+    def _select_few_shots(self, user_question: str) -> list:
+        if len(self.few_shots) <= FEW_SHOT_TOP_K:
+            return self.few_shots
+        question = embed_question(user_question)
+        scores = [cosine_similarity(question, vector) for vector in self._few_shot_vectors]
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        # Keep the configured example order for the ones that made the cut
+        return [self.few_shots[i] for i in sorted(ranked[:FEW_SHOT_TOP_K])]
+
     def _clean_sql_output(self, text: str) -> str:
-        if not text:
-            return text
-        cleaned = text.strip()
-        # Remove fenced code blocks ```sql ... ``` or ``` ...
-        fenced_match = re.search(r"```[a-zA-Z]*\s*([\s\S]*?)```", cleaned)
-        if fenced_match:
-            cleaned = fenced_match.group(1).strip()
-        # Remove leading labels like 'SQL:', 'SQL QUERY:', etc.
-        cleaned = re.sub(r"^(SQL\\s*QUERY\\s*:|SQL\\s*:)", "", cleaned, flags=re.IGNORECASE).strip()
-        # If multiple lines, take the first line that starts with SELECT
-        lines = [ln.strip() for ln in cleaned.splitlines() if ln.strip()]
-        for ln in lines:
-            if ln.upper().startswith("SELECT"):
-                return ln.rstrip(";") + ";"
-        # Fallback: try to extract the first SELECT ... ; span
-        m = re.search(r"(SELECT[\\s\\S]+?;)", cleaned, flags=re.IGNORECASE)
-        if m:
-            return m.group(1).strip()
-        # Last fallback: return cleaned as-is
-        return cleaned
+        return clean_sql_output(text)
+
+
+# Process-wide SQLGenerator instances keyed by (few-shot fingerprint, API key, validator)
+_SQL_GENERATOR_CACHE_SIZE = 4
+_sql_generators = OrderedDict()
+_sql_generators_lock = threading.Lock()
+
+
+def get_sql_generator(few_shots: list, api_key: str, validator=None) -> SQLGenerator:
+    """Return a shared SQLGenerator so schema, prompt prefix and Gemini client are built once."""
+    key = (_fingerprint(json.dumps(few_shots, sort_keys=True)), api_key, validator)
+    with _sql_generators_lock:
+        sql_generator = _sql_generators.get(key)
+        if sql_generator is None:
+            sql_generator = SQLGenerator(few_shots=few_shots, api_key=api_key, validator=validator)
+            _sql_generators[key] = sql_generator
+            if len(_sql_generators) > _SQL_GENERATOR_CACHE_SIZE:
+                _sql_generators.popitem(last=False)
+        else:
+            _sql_generators.move_to_end(key)
+        return sql_generator
 
 
 if __name__ == "__main__":
+    # Manual smoke test: python -m backend.ai.sql_generator
+    # Environment loading stays here so importing this module never touches .env files
+    from ..config import load_environment, get_settings
+
+    load_environment()
+
     few_shots = [
         {
             "q": "How many claims are pending?",
@@ -67,6 +329,6 @@ if __name__ == "__main__":
         },
     ]
 
-    sql_gen = SQLGenerator(few_shots)
+    sql_gen = SQLGenerator(few_shots, api_key=get_settings().gemini_api_key)
     sample_question = "Give me report for pending approvals for last month"
-    sql_gen.generate_query(sample_question)
+    print(sql_gen.generate_query(sample_question))
@@ -0,0 +1,83 @@
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+logger = logging.getLogger(__name__)
+
+# Load API key from .env.local file
+ENV_PATH = Path(__file__).parent / ".env.local"
+# Oracle settings have historically lived in a plain .env next to the backend
+DOTENV_PATH = Path(__file__).parent / ".env"
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_environment(env_path: Path = ENV_PATH):
+    """
+    Load backend/.env.local into the process environment.
+    Idempotent: only the first successful call per process reads the file.
+    Raises RuntimeError if Settings (environment, backend/.env, backend/.env.local)
+    has no GEMINI_API_KEY.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+
+        logger.info("Looking for .env.local file at: %s", env_path)
+
+        if env_path.exists():
+            logger.info(".env.local file found at %s", env_path)
+            load_dotenv(dotenv_path=env_path)
+        else:
+            logger.warning(".env.local file not found at %s; using process environment", env_path)
+
+        # Without a Gemini key every request would fail, so refuse to start instead.
+        # Ask Settings, the same loader the request path uses, so .env counts too.
+        if not get_settings().gemini_api_key:
+            raise RuntimeError(
+                f"GEMINI_API_KEY is not configured: set it in {DOTENV_PATH}, {env_path} or the environment"
+            )
+        logger.info("GEMINI_API_KEY configured")
+        _env_loaded = True
+
+
+class Settings(BaseSettings):
+    """Application settings read from the environment, falling back to backend/.env and backend/.env.local."""
+
+    # Later files take priority; real environment variables override both
+    model_config = SettingsConfigDict(env_file=(DOTENV_PATH, ENV_PATH), env_file_encoding="utf-8", extra="ignore")
+
+    gemini_api_key: Optional[str] = None
+
+    # Oracle connection (env: ORACLE_JDBC_URL, ORACLE_USER, ORACLE_PASSWORD, PORT, SERVICE)
+    oracle_jdbc_url: Optional[str] = None
+    oracle_user: Optional[str] = None
+    oracle_password: Optional[str] = None
+    # Legacy fallbacks, used only when ORACLE_JDBC_URL doesn't carry a port / service
+    port: Optional[int] = None
+    service: Optional[str] = None
+
+    # Oracle session pool sizing (env: ORACLE_POOL_MIN, ORACLE_POOL_MAX, ...)
+    oracle_pool_min: int = 2
+    oracle_pool_max: int = 10
+    oracle_pool_increment: int = 1
+    # Seconds an idle session above the minimum is kept; 0 keeps it indefinitely
+    oracle_pool_timeout: int = 0
+    # Prepared statements cached per session, so repeated SQL skips re-parsing
+    oracle_stmt_cache_size: int = 50
+    # Seconds a session may sit idle before acquire() pings it first
+    oracle_pool_ping_interval: int = 60
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Process-wide Settings instance, validated once on first use."""
+    return Settings()
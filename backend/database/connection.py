@@ -1,37 +1,222 @@
-from dotenv import load_dotenv
-import os
-import cx_Oracle
-from urllib.parse import urlparse
+import asyncio
+import logging
+import re
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import NamedTuple
+import oracledb
 
-load_dotenv()  # Load environment variables from .env file
+try:
+    from ..config import get_settings  # when imported as backend.database.connection
+except ImportError:
+    from backend.config import get_settings  # when run with absolute path
 
-jdbc_url = os.getenv("ORACLE_JDBC_URL")
-username = os.getenv("ORACLE_USER")
-password = os.getenv("ORACLE_PASSWORD")
-port = os.getenv("PORT")
-service_name = os.getenv("SERVICE")
+logger = logging.getLogger(__name__)
 
-#print(jdbc_url, username, password)
+class ConnectionParams(NamedTuple):
+    user: str
+    password: str
+    dsn: str
 
-dsn = cx_Oracle.makedsn(jdbc_url, port, service_name=service_name)
 
-#print(dsn)
-try:
-    # Connect to the database
-    connection = cx_Oracle.connect(username, password, dsn)
-    print("Connection successful!")
+_connection_params = None
+
+# jdbc:oracle:thin:@[//]host[:port][/service_name | :SID]
+_JDBC_RE = re.compile(
+    r"^jdbc:oracle:thin:@(?://)?(?P<host>[^:/]+)(?::(?P<port>\d+))?(?:(?P<sep>[:/])(?P<name>.+))?$"
+)
+
+
+def parse_jdbc_url(jdbc_url: str):
+    """
+    Split an Oracle thin JDBC URL into (host, port, service_name, sid). "host:port/name"
+    names a service, "host:port:name" a SID. Parts missing from the URL come back as None;
+    a value that isn't a JDBC URL is treated as a bare host name.
+    """
+    m = _JDBC_RE.match(jdbc_url or "")
+    if not m:
+        return jdbc_url, None, None, None
+    port = m.group("port")
+    name = m.group("name")
+    if m.group("sep") == ":":
+        return m.group("host"), int(port) if port else None, None, name
+    return m.group("host"), int(port) if port else None, name, None
+
+
+def get_connection_params() -> ConnectionParams:
+    """Oracle credentials and DSN, resolved from settings once per process."""
+    global _connection_params
+    if _connection_params is None:
+        settings = get_settings()
+        host, url_port, url_service, url_sid = parse_jdbc_url(settings.oracle_jdbc_url)
+        # The URL wins; the legacy PORT / SERVICE settings only fill in what a bare-host URL
+        # leaves out (PORT is often the platform's HTTP port, so it must not override)
+        service = url_service or (None if url_sid else settings.service)
+        dsn = oracledb.makedsn(
+            host,
+            url_port or settings.port,
+            sid=url_sid,
+            service_name=service,
+        )
+        _connection_params = ConnectionParams(settings.oracle_user, settings.oracle_password, dsn)
+    return _connection_params
+
+
+# Hand CLOB/BLOB columns back as str/bytes inline with the row instead of as LOB locators
+oracledb.defaults.fetch_lobs = False
+
+_DATETIME_TYPES = (
+    oracledb.DB_TYPE_DATE,
+    oracledb.DB_TYPE_TIMESTAMP,
+    oracledb.DB_TYPE_TIMESTAMP_TZ,
+    oracledb.DB_TYPE_TIMESTAMP_LTZ,
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+_async_pool = None
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _output_type_handler(cursor, metadata):
+    # Dates and timestamps become ISO-8601 strings as they are fetched
+    if metadata.type_code in _DATETIME_TYPES:
+        return cursor.var(metadata.type_code, arraysize=cursor.arraysize, outconverter=_isoformat)
+    return None
+
+
+def _pool_kwargs() -> dict:
+    # Session pool shared by all queries; sessions are reused instead of reconnecting per query
+    params = get_connection_params()
+    settings = get_settings()
+    return dict(
+        user=params.user,
+        password=params.password,
+        dsn=params.dsn,
+        min=settings.oracle_pool_min,
+        max=settings.oracle_pool_max,
+        increment=settings.oracle_pool_increment,
+        timeout=settings.oracle_pool_timeout,
+        ping_interval=settings.oracle_pool_ping_interval,
+        getmode=oracledb.POOL_GETMODE_WAIT,
+        homogeneous=True,
+        stmtcachesize=settings.oracle_stmt_cache_size,
+    )
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = oracledb.create_pool(**_pool_kwargs())
+    return _pool
+
+
+def get_db_connection():
+    # Borrow a session from the pool; hand it back with release_db_connection()
+    connection = get_pool().acquire()
+    connection.outputtypehandler = _output_type_handler
+    return connection
+
+
+def release_db_connection(connection):
+    get_pool().release(connection)
+
+
+@contextmanager
+def get_db_cursor():
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    finally:
+        release_db_connection(connection)
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_async_pool():
+    # Created on first use from inside the running event loop
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = oracledb.create_pool_async(**_pool_kwargs())
+    return _async_pool
+
+
+@asynccontextmanager
+async def get_async_db_cursor():
+    async with get_async_pool().acquire() as connection:
+        connection.outputtypehandler = _output_type_handler
+        with connection.cursor() as cursor:
+            yield cursor
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        pool, _async_pool = _async_pool, None
+        await pool.close()
+
+
+async def warm_async_pool():
+    # Open the pool's minimum sessions in parallel so the first queries don't pay connect + auth
+    pool = get_async_pool()
+    results = await asyncio.gather(*(pool.acquire() for _ in range(pool.min)), return_exceptions=True)
+    # Hand back every session that was opened, even if some acquires failed,
+    # so shutdown isn't left with busy connections
+    connections = [r for r in results if not isinstance(r, BaseException)]
+    try:
+        for r in results:
+            if isinstance(r, BaseException):
+                raise r
+        await asyncio.gather(*(connection.ping() for connection in connections))
+    finally:
+        await asyncio.gather(*(pool.release(connection) for connection in connections))
 
-    # Create a cursor
-    cursor = connection.cursor()
 
-    # Run a sample query, replace 'your_table' with a real table name
-    cursor.execute("SELECT * FROM ASRIT_PATIENT WHERE ROWNUM = 1")
-    result = cursor.fetchone()
-    print("Sample query result:", result)
+@asynccontextmanager
+async def db_lifespan(app):
+    """
+    Open the async pool before the app takes traffic and close both pools on shutdown.
+    Skipped when no Oracle URL is configured, so SQL generation alone still starts.
+    """
+    if not get_settings().oracle_jdbc_url:
+        logger.warning("ORACLE_JDBC_URL is not configured; database pool not started")
+        yield
+        return
+    try:
+        await warm_async_pool()
+        logger.info("Oracle connection pool warmed up")
+    except Exception as e:
+        # Queries will still connect on demand
+        logger.warning("Oracle pool warmup failed, continuing without it: %s", e)
+    try:
+        yield
+    finally:
+        await close_async_pool()
+        await asyncio.to_thread(close_pool)
 
-except cx_Oracle.DatabaseError as e:
-    print("Database connection or query failed:", e)
 
-finally:
-    if 'connection' in locals():
-        connection.close()
+if __name__ == "__main__":
+    # Smoke test through the same pooled path the app uses
+    try:
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT * FROM ASRIT_PATIENT WHERE ROWNUM = 1")
+            print("Sample query result:", cursor.fetchone())
+    except oracledb.DatabaseError as e:
+        print("Database connection or query failed:", e)
+    finally:
+        close_pool()
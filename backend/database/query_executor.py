@@ -1 +1,124 @@
+import json
+import logging
+import re
 
+try:
+    import orjson  # faster JSON parsing when available
+except ImportError:
+    orjson = None
+
+from .connection import get_async_db_cursor, get_db_cursor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ROWS = 1000
+# Rows per network round-trip; the driver defaults (arraysize=100, prefetchrows=2)
+# turn a large result into dozens of round-trips
+MAX_ARRAYSIZE = 1000
+UNBOUNDED_ARRAYSIZE = 5000
+
+# Queries that already page themselves are left alone
+_ROW_LIMIT_RE = re.compile(r"\bFETCH\s+(?:FIRST|NEXT)\b|\bOFFSET\s+\S+\s+ROWS?\b", re.IGNORECASE)
+
+
+def _dict_row_factory(columns: list):
+    return lambda *row: dict(zip(columns, row))
+
+
+def _clean_sql_query(sql: str) -> str:
+    # The driver rejects a trailing ';'; strip any run of semicolons/whitespace in one pass
+    return sql.strip().rstrip("; \t\n\r") if sql else sql
+
+
+def _prepare(sql: str, params: dict, max_rows: int):
+    sql = _clean_sql_query(sql)
+    bind = params or {}
+    if max_rows is not None and not _ROW_LIMIT_RE.search(sql):
+        # Let Oracle stop at max_rows instead of producing rows we'd discard (12c+);
+        # the limit is a bind so every max_rows shares one cached statement
+        sql += "\nFETCH FIRST :row_limit ROWS ONLY"  # own line, so a trailing -- comment cannot swallow it
+        bind = dict(bind, row_limit=max_rows)
+    arraysize = UNBOUNDED_ARRAYSIZE if max_rows is None else max(1, min(max_rows, MAX_ARRAYSIZE))
+    return sql, bind, arraysize
+
+
+def execute_query(sql: str, params: dict = None, max_rows: int = DEFAULT_MAX_ROWS) -> list:
+    """
+    Run a read-only query on a pooled session and return up to `max_rows` rows
+    as a list of {column_name: value} dicts. Pass max_rows=None to fetch everything.
+    """
+    sql, bind, arraysize = _prepare(sql, params, max_rows)
+    with get_db_cursor() as cursor:
+        cursor.arraysize = arraysize
+        # One extra row lets a result that fits in the first batch finish in a single round-trip
+        cursor.prefetchrows = arraysize + 1
+        cursor.execute(sql, bind)
+        # Build each row's dict as the driver yields it; LOBs and dates are already
+        # converted by the driver settings in connection.py
+        cursor.rowfactory = _dict_row_factory([desc[0] for desc in cursor.description])
+        rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows)
+        logger.info("Query returned %d rows", len(rows))
+        return rows
+
+
+async def execute_query_async(sql: str, params: dict = None, max_rows: int = DEFAULT_MAX_ROWS) -> list:
+    """execute_query on the asyncio pool, so concurrent report queries don't each hold a thread."""
+    sql, bind, arraysize = _prepare(sql, params, max_rows)
+    async with get_async_db_cursor() as cursor:
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = arraysize + 1
+        await cursor.execute(sql, bind)
+        cursor.rowfactory = _dict_row_factory([desc[0] for desc in cursor.description])
+        rows = await cursor.fetchall() if max_rows is None else await cursor.fetchmany(max_rows)
+        logger.info("Query returned %d rows", len(rows))
+        return rows
+
+
+def execute_query_columnar(sql: str, params: dict = None, max_rows: int = DEFAULT_MAX_ROWS) -> dict:
+    """
+    Like execute_query, but returns {column_name: [values...]} so the rows can go
+    straight into a DataFrame or JSON encoder without a dict per row.
+    """
+    sql, bind, arraysize = _prepare(sql, params, max_rows)
+    with get_db_cursor() as cursor:
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = arraysize + 1
+        cursor.execute(sql, bind)
+        columns = [desc[0] for desc in cursor.description]
+        rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows)
+    logger.info("Query returned %d rows", len(rows))
+    if not rows:
+        return {name: [] for name in columns}
+    return {name: list(values) for name, values in zip(columns, zip(*rows))}
+
+
+def execute_query_json(sql: str, params: dict = None, max_rows: int = DEFAULT_MAX_ROWS) -> list:
+    """
+    Like execute_query, but Oracle builds the rows as one JSON document
+    (JSON_ARRAYAGG/JSON_OBJECT(*), Oracle 19c+) so Python parses a single string
+    instead of constructing a dict per row. Pass max_rows=None to fetch everything.
+
+    Limits, from wrapping the query as FROM (<sql>):
+    - a select list with duplicate column names (e.g. two ID columns from a join
+      without aliases) raises ORA-00918; use execute_query for those
+    - JSON_ARRAYAGG doesn't promise to keep the inner ORDER BY, so row order is
+      not guaranteed; callers that need ordered rows should use execute_query
+    """
+    sql = _clean_sql_query(sql)
+    json_sql = f"SELECT JSON_ARRAYAGG(JSON_OBJECT(*) RETURNING CLOB) FROM ({sql})"
+    bind = dict(params or {})
+    if max_rows is not None:
+        json_sql += " WHERE ROWNUM <= :json_max_rows"
+        bind["json_max_rows"] = max_rows
+    with get_db_cursor() as cursor:
+        cursor.execute(json_sql, bind)
+        # The CLOB comes back as str since LOB fetching is turned off in connection.py
+        document = cursor.fetchone()[0]
+    if document is None:  # JSON_ARRAYAGG over no rows
+        rows = []
+    elif orjson is not None:
+        rows = orjson.loads(document)
+    else:
+        rows = json.loads(document)
+    logger.info("Query returned %d rows", len(rows))
+    return rows
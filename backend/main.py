@@ -13,6 +13,15 @@ API Endpoints Testing Commands:
        "query": "How many claims are pending?"
      }'
 
+   Streaming variant (NDJSON events: chunk..., then result or error):
+   curl -N -X POST http://localhost:8000/generate-sql/stream \
+     -H "Content-Type: application/json" \
+     -d '{
+       "user_name": "John Doe",
+       "user_email": "john.doe@example.com",
+       "query": "How many claims are pending?"
+     }'
+
    Example with complex query:
    curl -X POST http://localhost:8000/generate-sql \
      -H "Content-Type: application/json" \
@@ -25,15 +34,17 @@ API Endpoints Testing Commands:
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import logging
-import os
 import re
 import sys
 from typing import Optional
-import traceback
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv # Re-enabling dotenv import
 
 # Configure logging
 logging.basicConfig(
@@ -42,30 +53,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load API key from .env.local file
-env_path = Path(__file__).parent / ".env.local"
-logger.info(f"Looking for .env.local file at: {env_path}")
-
 # Ensure project root is on sys.path for flexible imports
 project_root = Path(__file__).resolve().parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-if env_path.exists():
-    logger.info(f".env.local file found at {env_path}")
-    load_dotenv(dotenv_path=env_path)
-    if os.getenv("GEMINI_API_KEY"):
-        logger.info(f"API key loaded from .env.local: {os.getenv('GEMINI_API_KEY')[:10]}...")
-    else:
-        logger.error("GEMINI_API_KEY not found in .env.local file")
-else:
-    logger.error(f".env.local file not found at {env_path}")
+try:
+    from .config import load_environment, get_settings  # when run as package: backend.main
+except ImportError:
+    from backend.config import load_environment, get_settings  # when run with absolute path
+
+try:
+    from .database.connection import db_lifespan  # when run as package: backend.main
+except ImportError:
+    from backend.database.connection import db_lifespan  # when run with absolute path
+
+
+async def warmup(app: FastAPI):
+    """
+    Pay one-time costs at startup instead of on the first user request:
+    schema load/format, Gemini client setup and context-cache creation, and the
+    first connection to the Gemini API. Failures are logged, never fatal.
+    """
+    try:
+        sql_generator = await get_app_sql_generator(app)
+        await sql_generator.gemini_client.aping()
+        logger.info("[Startup] SQL generator warmed up")
+    except HTTPException as e:
+        logger.warning("[Startup] Skipping warmup: %s", e.detail)
+    except Exception as e:
+        logger.warning("[Startup] Warmup failed, continuing without it: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Misconfiguration (no .env.local and no GEMINI_API_KEY) aborts startup here
+    load_environment()
+    async with db_lifespan(app):
+        await warmup(app)
+        yield
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Report Generator",
     description="AI-powered Medical Claims Analytics Bot - SQL Generation API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -77,8 +111,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Few-shot examples for SQL generation
-few_shots = [
+# Few-shot examples for SQL generation. The tuple only stops examples being added, removed
+# or reordered in place; the dicts inside stay mutable. The shared generator renders them
+# into its prompt once, when it is built, so treat them as read-only.
+few_shots = (
     {
         "user_name": "John Doe",
         "user_email": "john.doe@example.com",
@@ -95,7 +131,7 @@ few_shots = [
             "AND claim_date >= TRUNC(ADD_MONTHS(SYSDATE, -1), 'MM');"
         ),
     },
-]
+)
 
 # Request/Response Models
 class GenerateSQLRequest(BaseModel):
@@ -112,36 +148,84 @@ class GenerateSQLResponse(BaseModel):
 
 
 # SQL Validation
+# List of dangerous keywords that should not be present
+DANGEROUS_KEYWORDS = [
+    "INSERT", "UPDATE", "DELETE", "DROP", "TRUNCATE", 
+    "ALTER", "CREATE", "EXEC", "EXECUTE", "CALL",
+    "MERGE", "GRANT", "REVOKE", "COMMIT", "ROLLBACK"
+]
+# Use word boundary to avoid false positives (e.g., "SELECT" in "SELECTION");
+# one alternation scans the SQL once instead of once per keyword
+_DANGEROUS_KEYWORD_RE = re.compile(
+    r'\b(' + '|'.join(map(re.escape, DANGEROUS_KEYWORDS)) + r')\b'
+)
+# Both checks run on the same upper-cased text: the keywords are plain ASCII words, so \b(KW)\b
+# matches there exactly when KW is one of the \W+-separated words, and the two can't disagree
+_DANGEROUS_KEYWORD_SET = frozenset(DANGEROUS_KEYWORDS)
+_NON_WORD_RE = re.compile(r'\W+')
+
+
+@lru_cache(maxsize=256)
 def validate_sql(sql: str) -> tuple:
     """
     Validate that SQL is read-only (SELECT-only).
     Returns (is_valid, error_message)
+    Results are memoized: cached generations return byte-identical SQL.
     """
     if not sql or not sql.strip():
         return False, "SQL query is empty"
     
-    sql_upper = sql.strip().upper()
-    
     # Check if it starts with SELECT
-    # if not sql_upper.startswith("SELECT"):
+    # if not sql.lstrip().upper().startswith("SELECT"):
     #     return False, "Only SELECT queries are allowed"
     
-    # List of dangerous keywords that should not be present
-    dangerous_keywords = [
-        "INSERT", "UPDATE", "DELETE", "DROP", "TRUNCATE", 
-        "ALTER", "CREATE", "EXEC", "EXECUTE", "CALL",
-        "MERGE", "GRANT", "REVOKE", "COMMIT", "ROLLBACK"
-    ]
-    
-    for keyword in dangerous_keywords:
-        # Use word boundary to avoid false positives (e.g., "SELECT" in "SELECTION")
-        pattern = r'\b' + re.escape(keyword) + r'\b'
-        if re.search(pattern, sql_upper):
-            return False, f"Dangerous keyword '{keyword}' detected. Only SELECT queries are allowed"
+    sql_upper = sql.upper()
+    # Common case: no dangerous word at all, decided with set lookups only
+    if _DANGEROUS_KEYWORD_SET.isdisjoint(_NON_WORD_RE.split(sql_upper)):
+        return True, None
+
+    # Report the first offending keyword in the text
+    match = _DANGEROUS_KEYWORD_RE.search(sql_upper)
+    if match:
+        return False, f"Dangerous keyword '{match.group(1)}' detected. Only SELECT queries are allowed"
     
     return True, None
 
 
+def get_request_sql_generator():
+    # Import here to avoid circular imports; support both package and script runs
+    try:
+        from .ai.sql_generator import get_sql_generator  # when run as package: backend.main
+    except ImportError:
+        from backend.ai.sql_generator import get_sql_generator  # when run with absolute path
+
+    # Use the API key loaded at startup
+    current_api_key = get_settings().gemini_api_key
+    if not current_api_key:
+        logger.error("[API] GEMINI_API_KEY is not set in backend/.env.local file or environment")
+        raise HTTPException(
+            status_code=500,
+            detail="GEMINI_API_KEY is not configured in backend/.env.local file or environment"
+        )
+
+    # Shared SQL Generator for this API key, from get_sql_generator's cache.
+    # validate_sql keeps SQL the endpoints would reject out of the query cache.
+    return get_sql_generator(few_shots=few_shots, api_key=current_api_key, validator=validate_sql)
+
+
+async def get_app_sql_generator(app: FastAPI):
+    """
+    Return the generator kept on app.state since warmup. It is only rebuilt, off the
+    event loop, when missing or made stale by SQLGenerator.invalidate_schema_cache().
+    """
+    sql_generator = getattr(app.state, "sql_generator", None)
+    if sql_generator is None or not sql_generator.is_current():
+        # Building loads the schema and sets up the Gemini client and context cache
+        sql_generator = await asyncio.to_thread(get_request_sql_generator)
+        app.state.sql_generator = sql_generator
+    return sql_generator
+
+
 # Health Check Endpoint
 @app.get("/health")
 async def health_check():
@@ -165,41 +249,24 @@ async def generate_sql(request: GenerateSQLRequest):
     - status: Success or error status
     """
     try:
-        logger.info(f"[API] generate-sql: Processing query '{request.query}' with user_email {request.user_email}")
+        logger.info("[API] generate-sql: Processing query %r with user_email %s", request.query, request.user_email)
         
-        # Import here to avoid circular imports; support both package and script runs
-        try:
-            from .ai.sql_generator import SQLGenerator  # when run as package: backend.main
-        except ImportError:
-            from backend.ai.sql_generator import SQLGenerator  # when run with absolute path
-        
-        # Use the API key loaded at startup
-        current_api_key = os.getenv("GEMINI_API_KEY") # Using os.getenv again
-        if not current_api_key:
-            logger.error("[API] GEMINI_API_KEY is not set in backend/.env.local file or environment")
-            raise HTTPException(
-                status_code=500,
-                detail="GEMINI_API_KEY is not configured in backend/.env.local file or environment"
-            )
-
-        # Initialize SQL Generator with API key
-        logger.info(f"[API] Initializing SQL Generator with API key: {current_api_key[:10]}...")
-        sql_generator = SQLGenerator(few_shots=few_shots, api_key=current_api_key)
+        sql_generator = await get_app_sql_generator(app)
         
         # Generate SQL using AI
-        generated_sql = sql_generator.generate_query(request.query)
+        generated_sql = await sql_generator.agenerate_query(request.query)
         
         # Validate SQL is read-only
         is_valid, error_message = validate_sql(generated_sql)
         
         if not is_valid:
-            logger.warning(f"[API] generate-sql: Validation failed - {error_message} with user_email {request.user_email}")
+            logger.warning("[API] generate-sql: Validation failed - %s with user_email %s", error_message, request.user_email)
             raise HTTPException(
                 status_code=400,
                 detail=f"Generated SQL failed validation: {error_message}"
             )
         
-        logger.info(f"[API] generate-sql: Successfully generated SQL with user_email {request.user_email}")
+        logger.info("[API] generate-sql: Successfully generated SQL with user_email %s", request.user_email)
         
         return GenerateSQLResponse(
             user_name=request.user_name,
@@ -211,14 +278,54 @@ async def generate_sql(request: GenerateSQLRequest):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"[API] generate-sql: Error - {str(e)} with user_email {request.user_email}")
-        logger.error(f"[API] generate-sql: Full traceback: {traceback.format_exc()}")
+        # logger.exception attaches the traceback; formatted only if the record is emitted
+        logger.exception("[API] generate-sql: Error - %s with user_email %s", e, request.user_email)
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
 
 
+# Streaming Generate SQL Endpoint
+@app.post("/generate-sql/stream")
+async def generate_sql_stream(request: GenerateSQLRequest):
+    """
+    Same as /generate-sql, but streams newline-delimited JSON events while Gemini decodes:
+    - {"type": "chunk", "text": "..."} for each piece of raw model output
+    - {"type": "result", ...GenerateSQLResponse fields} once the SQL is cleaned and validated
+    - {"type": "error", "detail": "..."} if generation or validation fails
+    """
+    logger.info("[API] generate-sql/stream: Processing query %r with user_email %s", request.query, request.user_email)
+    sql_generator = await get_app_sql_generator(app)
+
+    async def events():
+        try:
+            parts = []
+            async for chunk in sql_generator.astream_query(request.query):
+                parts.append(chunk)
+                yield json.dumps({"type": "chunk", "text": chunk}) + "\n"
+
+            generated_sql = sql_generator._clean_sql_output("".join(parts))
+            is_valid, error_message = validate_sql(generated_sql)
+            if not is_valid:
+                logger.warning("[API] generate-sql/stream: Validation failed - %s with user_email %s", error_message, request.user_email)
+                yield json.dumps({"type": "error", "detail": f"Generated SQL failed validation: {error_message}"}) + "\n"
+                return
+
+            result = GenerateSQLResponse(
+                user_name=request.user_name,
+                user_email=request.user_email,
+                sql_query=generated_sql,
+                status="success"
+            )
+            yield json.dumps({"type": "result", **result.model_dump()}) + "\n"
+        except Exception as e:
+            logger.exception("[API] generate-sql/stream: Error - %s with user_email %s", e, request.user_email)
+            yield json.dumps({"type": "error", "detail": f"Internal server error: {str(e)}"}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file